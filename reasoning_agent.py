@@ -3,27 +3,162 @@ Multi-Step Reasoning Agent with Self-Checking
 A reasoning agent that solves structured problems through planning, execution, and verification.
 """
 
+import ast
+import asyncio
+import concurrent.futures
+import hashlib
 import json
+import math
+import operator
 import re
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass, asdict
+import sqlite3
+import sys
+import threading
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
+from dataclasses import dataclass
 import google.generativeai as genai
 import os
-import time
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv  # ← Add this
+from google.api_core.exceptions import ResourceExhausted
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 load_dotenv()  
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the standard library
+    orjson = None
 
-@dataclass
+
+def dump_json(obj: Any) -> str:
+    """Serialize obj as indented JSON (non-ASCII kept as-is), using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+def dump_json_bytes(obj: Any) -> bytes:
+    """Like dump_json(), but return UTF-8 bytes without an extra decode."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+
+
+# Gemini API free-tier request quota (requests per minute)
+FREE_TIER_QPM = 15
+
+
+# Shared background event loop for the synchronous entry points. Gemini's async
+# client binds its channel to the loop it is first used on, so every agent runs
+# its coroutines on this single long-lived loop instead of a fresh asyncio.run().
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared background event loop, starting it on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True).start()
+    return _loop
+
+
+_backoff = wait_random_exponential(multiplier=1, max=30)
+_RETRY_DELAY = re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)')
+
+
+def _rate_limit_wait(retry_state) -> float:
+    """Tenacity wait: honor Gemini's suggested retry delay, else back off with jitter."""
+    error = retry_state.outcome.exception()
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    match = _RETRY_DELAY.search(str(error))
+    if match:
+        return float(match.group(1))
+    return _backoff(retry_state)
+
+
+# "passed" verdicts in a verification response that isn't valid JSON
+_PASSED_RE = re.compile(r'"passed"\s*:\s*(true|false)')
+
+# Shared decoder for _extract_json(); raw_decode() parses a single JSON value
+# in one linear pass and ignores whatever follows it.
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _extract_json(text: str, array: bool = False) -> Any:
+    """
+    Extract a JSON object (or array) from an LLM response.
+    
+    Gemini often wraps JSON in markdown code blocks or surrounds it with prose.
+    
+    Args:
+        text: The raw response text
+        array: Look for a JSON array instead of an object
+        
+    Returns:
+        The parsed JSON value
+        
+    Raises:
+        json.JSONDecodeError: If no valid JSON can be found
+    """
+    # Skip past a leading ```json / ``` fence so prose before it can't match
+    fence = text.find('```')
+    search_from = 0 if fence == -1 else fence + 3
+    
+    start = text.find('[' if array else '{', search_from)
+    if start == -1:
+        kind = "array" if array else "object"
+        raise json.JSONDecodeError(f"No JSON {kind} found", text, search_from)
+    
+    value, _ = _JSON_DECODER.raw_decode(text, start)
+    return value
+
+
+class _DiskCache:
+    """Minimal persistent key -> text store backed by SQLite."""
+    
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+    
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+
+@dataclass(slots=True)
 class Check:
     """Represents a verification check"""
     check_name: str
     passed: bool
     details: str
 
+    def to_dict(self) -> dict:
+        return {"check_name": self.check_name, "passed": self.passed, "details": self.details}
+
 
-@dataclass
+@dataclass(slots=True)
 class AgentResponse:
     """Standard response format from the agent"""
     answer: str
@@ -32,92 +167,156 @@ class AgentResponse:
     metadata: Dict[str, Any]
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "answer": self.answer,
+            "status": self.status,
+            "reasoning_visible_to_user": self.reasoning_visible_to_user,
+            "metadata": dict(self.metadata),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AgentResponse":
+        return cls(
+            answer=data["answer"],
+            status=data["status"],
+            reasoning_visible_to_user=data["reasoning_visible_to_user"],
+            metadata=data["metadata"],
+        )
 
 
-class ReasoningAgent:
+class _CheckStreamParser:
     """
-    A multi-step reasoning agent that:
-    1. Plans the solution approach
-    2. Executes the plan
-    3. Verifies the solution
-    4. Retries if verification fails
+    Incrementally parse a streamed JSON array of checks.
+    
+    Each complete top-level object in the array is turned into a Check as soon
+    as its closing brace arrives, so callers can react before the stream ends.
     """
     
-    def __init__(self, api_key: Optional[str] = None, max_retries: int = 2):
-        """
-        Initialize the reasoning agent.
-        
-        Args:
-            api_key: Google AI Studio API key (reads from env if not provided)
-            max_retries: Maximum number of retry attempts if verification fails
-        """
-        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
-            raise ValueError("GEMINI_API_KEY not found. Please set it as an environment variable.")
+    def __init__(self):
+        self.text = ""
+        self._pos: Optional[int] = None  # where to look for the next check object
+    
+    def feed(self, chunk: str) -> List[Check]:
+        """Add a chunk of response text and return any newly completed checks."""
+        self.text += chunk
+        if self._pos is None:
+            # Skip past a leading ```json / ``` fence, then find the array
+            fence = self.text.find('```')
+            start = self.text.find('[', 0 if fence == -1 else fence + 3)
+            if start == -1:
+                return []
+            self._pos = start + 1
         
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('models/gemini-2.5-flash')
-        self.max_retries = max_retries
+        checks = []
+        while True:
+            start = self.text.find('{', self._pos)
+            if start == -1:
+                break
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.text, start)
+            except json.JSONDecodeError:
+                break  # Object not complete yet
+            self._pos = end
+            try:
+                checks.append(Check(**value))
+            except TypeError:
+                continue
+        return checks
+
+
+# gemini-2.5-flash thinks before answering, and its thinking tokens count
+# against max_output_tokens. The google-generativeai SDK can't set a thinking
+# budget, so each phase's cap on visible output gets this allowance on top.
+# That makes the total limits looser than a flat 2048; they only prevent
+# truncation, and don't bound latency (see README, Current Limitations).
+_THINKING_TOKENS = 8192
+
+
+class _IncompleteResponse(Exception):
+    """A streamed response ended before the model finished it."""
+
+
+def _hit_token_limit(response) -> bool:
+    """Return True if Gemini stopped generating because it ran out of output tokens."""
+    candidates = getattr(response, 'candidates', None)
+    return bool(candidates) and candidates[0].finish_reason == genai.protos.Candidate.FinishReason.MAX_TOKENS
+
+
+# Local arithmetic verification: "<expression> = <number>" lines in the work
+_EQUATION = re.compile(r'([-+*/().\d\s]+)=\s*([-+]?\d+(?:\.\d+)?)')
+# Work the equation pattern can't read in full: thousands separators and
+# operators other than + - * / (e.g. "3 × 4", "3 x 4", "2^3", "20%")
+_UNSUPPORTED_ARITH = re.compile(r'\d,\d{3}|\d\s*[xX×÷^%]|[×÷^]')
+_ARITH_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+def _eval_arithmetic(node: ast.AST) -> float:
+    """Evaluate an expression tree made only of numbers and + - * /."""
+    if isinstance(node, ast.Expression):
+        return _eval_arithmetic(node.body)
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITH_OPS:
+        return _ARITH_OPS[type(node.op)](_eval_arithmetic(node.left), _eval_arithmetic(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _ARITH_OPS:
+        return _ARITH_OPS[type(node.op)](_eval_arithmetic(node.operand))
+    raise ValueError("Not a plain arithmetic expression")
+
+
+def _local_verify(solution: Dict[str, Any]) -> Optional[List[Check]]:
+    """
+    Recompute the arithmetic in a solution's work to catch wrong calculations.
     
-    def _call_llm(self, prompt: str, system: str = "") -> str:
-        """
-        Call the LLM with a given prompt.
+    This can only reject a solution: correct arithmetic says nothing about
+    whether the right quantities were computed, so anything that isn't
+    provably wrong still goes to the LLM verifier.
+    
+    Args:
+        solution: The solution from the executor
         
-        Args:
-            prompt: The user prompt
-            system: Optional system prompt (prepended to user prompt for Gemini)
-            
-        Returns:
-            The model's response text
-        """
+    Returns:
+        A failed Arithmetic Check if a calculation is wrong, or None if the
+        work is consistent or can't be fully checked locally
+    """
+    work = str(solution.get('intermediate_work', ''))
+    if _UNSUPPORTED_ARITH.search(work):
+        return None
+    
+    wrong = []
+    for match in _EQUATION.finditer(work):
+        lhs, rhs = match.group(1).strip(), match.group(2)
+        # Skip labels like "Step 2 = ..." that contain no arithmetic
+        if not any(op in lhs.lstrip('-+') for op in '+-*/'):
+            continue
         try:
-            # Combine system prompt with user prompt for Gemini
-            full_prompt = f"{system}\n\n{prompt}" if system else prompt
-            
-            # Configure generation settings
-            generation_config = {
-                'temperature': 1.0,
-                'top_p': 0.95,
-                'top_k': 40,
-                'max_output_tokens': 2048,
-            }
-            
-            # Call Gemini API
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=generation_config
-            )
-            
-            # Handle rate limiting with exponential backoff
-            if hasattr(response, 'prompt_feedback'):
-                if response.prompt_feedback.block_reason:
-                    return "Error: Content was blocked by safety filters."
-            
-            return response.text
-            
-        except Exception as e:
-            # Handle rate limiting
-            if "429" in str(e) or "quota" in str(e).lower():
-                time.sleep(2)  # Wait 2 seconds and retry once
-                try:
-                    response = self.model.generate_content(full_prompt, generation_config=generation_config)
-                    return response.text
-                except:
-                    return f"Error: Rate limit exceeded. Please wait a moment and try again."
-            return f"Error calling LLM: {str(e)}"
-    
-    def plan(self, question: str) -> str:
-        """
-        Phase 1: Create a step-by-step plan to solve the problem.
-        
-        Args:
-            question: The user's question
-            
-        Returns:
-            A structured plan as text
-        """
-        planner_prompt = f"""Given the following question, create a detailed step-by-step plan to solve it.
+            value = _eval_arithmetic(ast.parse(lhs, mode='eval'))
+        except (SyntaxError, ValueError, ZeroDivisionError, RecursionError):
+            return None  # Something we can't evaluate; leave it to the LLM
+        # Allow for the rounding implied by the stated result
+        decimals = len(rhs.partition('.')[2])
+        tolerance = 0.5 * 10 ** -decimals if decimals else 1e-9
+        if abs(value - float(rhs)) <= tolerance:
+            continue
+        # "50 / 15 = 3 books" is whole-number division, not a mistake
+        if '/' in lhs and not decimals and float(rhs) in (math.floor(value), math.ceil(value)):
+            continue
+        wrong.append(f"{lhs} = {value:g}, not {rhs}")
+    
+    if not wrong:
+        return None
+    return [Check(check_name="Arithmetic Check", passed=False, details="; ".join(wrong))]
+
+
+# Prompt templates. The static instructions are built once at import time;
+# each phase only fills in its question/plan/solution slots with str.format().
+_PLAN_PROMPT = """Given the following question, create a detailed step-by-step plan to solve it.
 
 Your plan should:
 - Break down the problem into clear, logical steps
@@ -130,8 +329,8 @@ Output your plan as a numbered list of steps. Be concise but complete.
 Question: {question}
 
 Plan:"""
-        
-        system_prompt = """You are a problem-solving planner. Your job is to create clear, 
+
+_PLAN_SYSTEM = """You are a problem-solving planner. Your job is to create clear, 
 logical plans for solving word problems involving math, time, logic, and constraints.
 
 For each question:
@@ -143,20 +342,7 @@ For each question:
 
 Keep plans concise (5-8 steps typically) but thorough."""
 
-        return self._call_llm(planner_prompt, system_prompt)
-    
-    def execute(self, question: str, plan: str) -> Dict[str, Any]:
-        """
-        Phase 2: Execute the plan to produce a solution.
-        
-        Args:
-            question: The user's question
-            plan: The plan from the planner phase
-            
-        Returns:
-            Dictionary with 'answer', 'reasoning', and 'intermediate_work'
-        """
-        executor_prompt = f"""You are solving the following question by following a specific plan.
+_EXECUTE_PROMPT = """You are solving the following question by following a specific plan.
 
 Question: {question}
 
@@ -183,62 +369,57 @@ Make sure to:
 
 JSON Response:"""
 
-        system_prompt = """You are a precise problem solver. Execute plans carefully, showing 
+_EXECUTE_SYSTEM = """You are a precise problem solver. Execute plans carefully, showing 
 all intermediate work. Always output valid JSON in the exact format requested. 
 Be thorough in calculations and clear in explanations."""
 
-        response_text = self._call_llm(executor_prompt, system_prompt)
-        
-        # Extract JSON from response - Gemini often adds markdown
-        try:
-            # Remove markdown code blocks if present
-            cleaned_text = response_text.strip()
-            if '```json' in cleaned_text:
-                # Extract content between ```json and ```
-                json_match = re.search(r'```json\s*([\s\S]*?)\s*```', cleaned_text)
-                if json_match:
-                    cleaned_text = json_match.group(1)
-            elif '```' in cleaned_text:
-                # Extract content between ``` and ```
-                json_match = re.search(r'```\s*([\s\S]*?)\s*```', cleaned_text)
-                if json_match:
-                    cleaned_text = json_match.group(1)
-            
-            # Try to find JSON object
-            json_match = re.search(r'\{[\s\S]*\}', cleaned_text)
-            if json_match:
-                result = json.loads(json_match.group())
-            else:
-                result = json.loads(cleaned_text)
-            
-            return result
-        except (json.JSONDecodeError, AttributeError) as e:
-            # Fallback if JSON parsing fails
-            return {
-                "answer": "Error parsing response",
-                "reasoning": response_text[:200] if len(response_text) > 200 else response_text,
-                "intermediate_work": response_text
-            }
-    
-    def verify(self, question: str, solution: Dict[str, Any]) -> List[Check]:
-        """
-        Phase 3: Verify the solution for correctness and consistency.
-        
-        Args:
-            question: The original question
-            solution: The solution from the executor
-            
-        Returns:
-            List of Check objects indicating what passed/failed
-        """
-        verifier_prompt = f"""You are verifying a solution to a problem. Check if the solution is correct and consistent.
+_PLAN_AND_EXECUTE_PROMPT = """Solve the following question in two stages.
+
+First, create a step-by-step plan to solve it. Your plan should:
+- Break down the problem into clear, logical steps
+- Identify what information needs to be extracted
+- Specify any calculations or logic needed
+- Include a verification step at the end
+
+Then execute each step of the plan carefully. Show your intermediate work and calculations.
+
+Question: {question}
+
+IMPORTANT: Respond ONLY with valid JSON. Do not include any explanatory text before or after the JSON.
+
+Provide your response in this exact JSON format:
+{{
+    "plan": ["<step 1>", "<step 2>", "..."],
+    "answer": "<final short answer>",
+    "reasoning": "<brief explanation of how you got the answer>",
+    "intermediate_work": "<detailed step-by-step work showing calculations>"
+}}
+
+Make sure to:
+- Keep the plan concise (5-8 steps typically) but complete
+- Follow the plan exactly
+- Show all intermediate calculations
+- Double-check arithmetic
+- Provide a clear, concise final answer
+- OUTPUT ONLY THE JSON, NOTHING ELSE
+
+JSON Response:"""
+
+_PLAN_AND_EXECUTE_MAX_TOKENS = 1536
+
+_PLAN_AND_EXECUTE_SYSTEM = """You are a precise problem solver for word problems involving math, time, 
+logic, and constraints. Plan clearly, then execute the plan carefully, showing all 
+intermediate work. Always output valid JSON in the exact format requested. 
+Be thorough in calculations and clear in explanations."""
+
+_VERIFY_PROMPT = """You are verifying a solution to a problem. Check if the solution is correct and consistent.
 
 Question: {question}
 
 Proposed Solution:
-Answer: {solution['answer']}
-Reasoning: {solution['reasoning']}
-Work: {solution['intermediate_work']}
+Answer: {answer}
+Reasoning: {reasoning}
+Work: {work}
 
 Perform the following checks:
 1. **Correctness Check**: Re-solve the problem independently. Does your answer match?
@@ -268,58 +449,103 @@ OUTPUT ONLY THE JSON ARRAY, NOTHING ELSE
 
 JSON Array:"""
 
-        system_prompt = """You are a rigorous verifier. Re-solve problems independently to check 
+_VERIFY_SYSTEM = """You are a rigorous verifier. Re-solve problems independently to check 
 answers. Verify arithmetic, logic, and constraints. Output only valid JSON in the requested format.
 Be thorough and catch any errors or inconsistencies."""
 
-        response_text = self._call_llm(verifier_prompt, system_prompt)
+_VERIFY_BATCH_PROMPT = """You are verifying {count} candidate solutions to a problem. Check each one independently for correctness and consistency.
+
+Question: {question}
+
+Candidate Solutions:
+{candidates}
+
+For EACH candidate, perform the following checks:
+1. **Correctness Check**: Re-solve the problem independently. Does the candidate's answer match?
+2. **Arithmetic Check**: Verify all calculations in the candidate's work.
+3. **Logic Check**: Is the reasoning sound and does it follow logically?
+4. **Constraint Check**: Are all constraints from the question satisfied?
+5. **Units Check**: Are units consistent and correct?
+
+IMPORTANT: Respond ONLY with valid JSON. Do not include any explanatory text before or after the JSON.
+
+Provide your verification as a JSON array with one inner array of checks per candidate,
+in candidate id order, using this exact format:
+[
+    [
+        {{
+            "check_name": "Correctness Check",
+            "passed": true,
+            "details": "explanation here"
+        }},
+        {{
+            "check_name": "Arithmetic Check",
+            "passed": true,
+            "details": "explanation here"
+        }}
+    ]
+]
+
+Be strict but fair. If something is wrong, explain what and why.
+OUTPUT ONLY THE JSON ARRAY, NOTHING ELSE
+
+JSON Array:"""
+
+
+class _SolveEntryPoints:
+    """
+    Public solve methods shared by the agents, built on a _solve() coroutine
+    that the subclass implements and that always runs on the shared loop.
+    """
+    
+    async def _solve(self, question: str) -> AgentResponse:
+        raise NotImplementedError
+    
+    def solve(self, question: str) -> AgentResponse:
+        """
+        Main entry point: solve a question using the full agent pipeline.
         
-        # Extract JSON from response - Gemini often adds markdown
-        try:
-            # Remove markdown code blocks if present
-            cleaned_text = response_text.strip()
-            if '```json' in cleaned_text:
-                # Extract content between ```json and ```
-                json_match = re.search(r'```json\s*([\s\S]*?)\s*```', cleaned_text)
-                if json_match:
-                    cleaned_text = json_match.group(1)
-            elif '```' in cleaned_text:
-                # Extract content between ``` and ```
-                json_match = re.search(r'```\s*([\s\S]*?)\s*```', cleaned_text)
-                if json_match:
-                    cleaned_text = json_match.group(1)
+        Synchronous wrapper around solve_async() for the CLI and Streamlit app.
+        
+        Args:
+            question: The user's question
             
-            # Try to find JSON array
-            json_match = re.search(r'\[[\s\S]*\]', cleaned_text)
-            if json_match:
-                checks_data = json.loads(json_match.group())
-            else:
-                checks_data = json.loads(cleaned_text)
+        Returns:
+            AgentResponse with answer, status, and metadata
+        """
+        return self.submit(question).result()
+    
+    def submit(self, question: str) -> concurrent.futures.Future:
+        """
+        Start solving a question in the background and return immediately.
+        
+        Submitted questions run concurrently, bounded by max_concurrency.
+        
+        Args:
+            question: The user's question
             
-            checks = [Check(**check) for check in checks_data]
-            return checks
-        except (json.JSONDecodeError, TypeError, KeyError) as e:
-            # If JSON parsing fails, create a simple passing check
-            # This is more lenient to avoid false failures
-            print(f"Warning: Could not parse verification JSON. Response was: {response_text[:200]}")
+        Returns:
+            A concurrent.futures.Future that resolves to the AgentResponse
+        """
+        return asyncio.run_coroutine_threadsafe(self._solve(question), _get_loop())
+    
+    async def solve_many(self, questions: List[str]) -> List[AgentResponse]:
+        """
+        Solve several independent questions concurrently.
+        
+        Args:
+            questions: The questions to solve
             
-            # Try to determine if answer seems correct from response text
-            if "correct" in response_text.lower() or "4" in response_text:
-                return [Check(
-                    check_name="Basic Verification",
-                    passed=True,
-                    details="Verification response indicates correctness (JSON parsing failed but content seems valid)"
-                )]
-            else:
-                return [Check(
-                    check_name="Verification Error",
-                    passed=False,
-                    details=f"Could not parse verification properly. Raw response: {response_text[:200]}"
-                )]
+        Returns:
+            AgentResponses in the same order as the questions
+        """
+        return await asyncio.gather(*(self.solve_async(q) for q in questions))
     
-    def solve(self, question: str) -> AgentResponse:
+    async def solve_async(self, question: str) -> AgentResponse:
         """
-        Main entry point: solve a question using the full agent pipeline.
+        Solve a question using the full agent pipeline.
+        
+        Can be awaited from any event loop, e.g. under asyncio.run().
         
         Args:
             question: The user's question
@@ -327,24 +553,489 @@ Be thorough and catch any errors or inconsistencies."""
         Returns:
             AgentResponse with answer, status, and metadata
         """
-        retry_count = 0
-        all_checks = []
+        if asyncio.get_running_loop() is _get_loop():
+            return await self._solve(question)
+        # The request semaphore and Gemini's gRPC channel belong to the
+        # shared loop, so run there and wait from this one
+        return await asyncio.wrap_future(self.submit(question))
+
+
+class ReasoningAgent(_SolveEntryPoints):
+    """
+    A multi-step reasoning agent that:
+    1. Plans the solution approach
+    2. Executes the plan
+    3. Verifies the solution
+    4. Retries if verification fails
+    
+    The solve methods may be used from any thread or event loop. The phase
+    coroutines (plan, execute, plan_and_execute, verify, verify_batch) share
+    the agent's request semaphore and gRPC channel, so await them only on
+    the shared loop that solve_async() runs on.
+    """
+    
+    def __init__(self, api_key: Optional[str] = None, max_retries: int = 2,
+                 max_concurrency: int = 4, use_cache: bool = True,
+                 max_qpm: int = FREE_TIER_QPM):
+        """
+        Initialize the reasoning agent.
+        
+        Args:
+            api_key: Google AI Studio API key (reads from env if not provided)
+            max_retries: Maximum number of retry attempts if verification fails
+            max_concurrency: Maximum number of in-flight Gemini requests
+            use_cache: Reuse LLM responses for identical prompts from an
+                on-disk cache (.llm_cache); attempts that fail verification
+                are evicted so they are resampled on the next solve
+            max_qpm: Gemini request quota per minute, enforced client-side
+                (defaults to the free tier; raise it for paid quotas)
+        """
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            raise ValueError("GEMINI_API_KEY not found. Please set it as an environment variable.")
+        
+        genai.configure(api_key=self.api_key)
+        self.model = genai.GenerativeModel('models/gemini-2.5-flash')
+        
+        # Generation settings are fixed apart from the per-phase output cap;
+        # one config per cap is built on first use and reused
+        self._gen_settings = {
+            'temperature': 1.0,
+            'top_p': 0.95,
+            'top_k': 40,
+        }
+        self._gen_cfgs: Dict[int, Tuple[genai.types.GenerationConfig, str]] = {}
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.max_qpm = max_qpm
+        self._limiter = AsyncLimiter(max_qpm, 60)
+        self._cache = _DiskCache(".llm_cache") if use_cache else None
+    
+    async def _call_llm(self, prompt: str, system: str = "", attempt: int = 0,
+                        max_tokens: int = 2048) -> str:
+        """
+        Call the LLM with a given prompt.
+        
+        Args:
+            prompt: The user prompt
+            system: Optional system prompt (prepended to user prompt for Gemini)
+            attempt: Attempt index, part of the cache key so that parallel
+                attempts at the same question stay independent
+            max_tokens: Maximum number of visible output tokens for this call
+                (thinking tokens are allowed for separately)
+            
+        Returns:
+            The model's response text
+        """
+        # Combine system prompt with user prompt for Gemini
+        full_prompt = f"{system}\n\n{prompt}" if system else prompt
+        
+        generation_config, config_key = self._generation_config(max_tokens)
+        cache_key = self._cache_key(prompt, system, attempt, config_key)
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        text, ok = await self._generate(full_prompt, generation_config)
+        # Only cache real model output, never error messages
+        if cache_key is not None and ok:
+            self._cache.set(cache_key, text)
+        return text
+    
+    async def _stream_llm(self, prompt: str, system: str = "", attempt: int = 0,
+                          max_tokens: int = 2048) -> AsyncIterator[str]:
+        """
+        Call the LLM with a given prompt and yield the response text as it arrives.
+        
+        Callers that stop early must aclose() the generator so the request
+        slot and HTTP stream are released promptly. Only complete responses
+        are cached.
+        
+        Args:
+            prompt: The user prompt
+            system: Optional system prompt (prepended to user prompt for Gemini)
+            attempt: Attempt index (see _call_llm)
+            max_tokens: Maximum number of visible output tokens for this call
+                (thinking tokens are allowed for separately)
+            
+        Yields:
+            Chunks of the model's response text
+            
+        Raises:
+            _IncompleteResponse: After the last chunk that arrived, if the
+                response stopped at the output token limit or the stream
+                broke off part-way
+        """
+        # Combine system prompt with user prompt for Gemini
+        full_prompt = f"{system}\n\n{prompt}" if system else prompt
+        
+        generation_config, config_key = self._generation_config(max_tokens)
+        cache_key = self._cache_key(prompt, system, attempt, config_key)
+        if cache_key is not None:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        chunks = []
+        stream_error: Optional[Exception] = None
+        truncated = False
+        async with self._limiter, self._request_slot():
+            try:
+                response = await self.model.generate_content_async(
+                    full_prompt,
+                    generation_config=generation_config,
+                    stream=True
+                )
+                async for chunk in response:
+                    if chunk.parts:
+                        chunks.append(chunk.text)
+                        yield chunk.text
+                    truncated = truncated or _hit_token_limit(chunk)
+            except Exception as e:
+                stream_error = e
+        
+        if truncated:
+            raise _IncompleteResponse("cut off at the output token limit")
+        
+        if stream_error is not None:
+            if chunks:
+                # Part of the response was already yielded and can't be
+                # completed, so the caller must not treat it as whole
+                raise _IncompleteResponse(f"stream interrupted: {stream_error}")
+            # Nothing usable arrived: retry without streaming, which also
+            # handles rate limiting and error messages
+            yield await self._call_llm(prompt, system, attempt, max_tokens)
+            return
+        
+        if cache_key is not None:
+            self._cache.set(cache_key, "".join(chunks))
+    
+    def _generation_config(self, max_tokens: int) -> Tuple[genai.types.GenerationConfig, str]:
+        """Return the generation config for an output cap and its cache-key form."""
+        if max_tokens not in self._gen_cfgs:
+            settings = dict(self._gen_settings, max_output_tokens=max_tokens + _THINKING_TOKENS)
+            self._gen_cfgs[max_tokens] = (
+                genai.types.GenerationConfig(**settings),
+                json.dumps(settings, sort_keys=True),
+            )
+        return self._gen_cfgs[max_tokens]
+    
+    def _cache_key(self, prompt: str, system: str, attempt: int,
+                   config_key: str) -> Optional[str]:
+        """Return the LLM cache key for a call, or None when caching is disabled."""
+        if self._cache is None:
+            return None
+        return hashlib.blake2b("\0".join([
+            system, prompt, self.model.model_name, config_key, str(attempt)
+        ]).encode()).hexdigest()
+    
+    def _forget(self, prompt: str, system: str, attempt: int, max_tokens: int) -> None:
+        """Drop a cached LLM response so the call is resampled next time."""
+        cache_key = self._cache_key(prompt, system, attempt, self._generation_config(max_tokens)[1])
+        if cache_key is not None:
+            self._cache.delete(cache_key)
+    
+    def _forget_candidate(self, question: str, attempt: int) -> None:
+        """Drop a cached plan_and_execute() response for a rejected attempt."""
+        self._forget(_PLAN_AND_EXECUTE_PROMPT.format(question=question),
+                     _PLAN_AND_EXECUTE_SYSTEM, attempt, _PLAN_AND_EXECUTE_MAX_TOKENS)
+    
+    def _request_slot(self) -> asyncio.Semaphore:
+        """Return the semaphore bounding in-flight Gemini requests."""
+        # Created lazily so it binds to the loop the agent actually runs on
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+    
+    async def _generate(self, full_prompt: str,
+                        generation_config: genai.types.GenerationConfig) -> Tuple[str, bool]:
+        """
+        Send a prompt to Gemini, bounded by the QPM and concurrency limits.
+        
+        Args:
+            full_prompt: The combined system and user prompt
+            generation_config: Gemini generation settings
+            
+        Returns:
+            Tuple of (response text or error message, whether the call succeeded)
+        """
+        try:
+            # Retry rate-limit errors, waiting as long as Gemini asks
+            async for retry in AsyncRetrying(
+                retry=retry_if_exception_type(ResourceExhausted),
+                wait=_rate_limit_wait,
+                stop=stop_after_attempt(4),
+                reraise=True,
+            ):
+                with retry:
+                    async with self._limiter, self._request_slot():
+                        # Call Gemini API
+                        response = await self.model.generate_content_async(
+                            full_prompt,
+                            generation_config=generation_config
+                        )
+            
+            if hasattr(response, 'prompt_feedback'):
+                if response.prompt_feedback.block_reason:
+                    return "Error: Content was blocked by safety filters.", False
+            
+            # A cut-off response is unusable (and may have no text at all)
+            if _hit_token_limit(response):
+                return "Error: Response was cut off at the output token limit.", False
+            
+            return response.text, True
+            
+        except ResourceExhausted:
+            return "Error: Rate limit exceeded. Please wait a moment and try again.", False
+        except Exception as e:
+            return f"Error calling LLM: {str(e)}", False
+    
+    async def plan(self, question: str, attempt: int = 0) -> str:
+        """
+        Phase 1: Create a step-by-step plan to solve the problem.
+        
+        Args:
+            question: The user's question
+            attempt: Attempt index (see _call_llm)
+            
+        Returns:
+            A structured plan as text
+        """
+        planner_prompt = _PLAN_PROMPT.format(question=question)
+        
+        system_prompt = _PLAN_SYSTEM
+
+        return await self._call_llm(planner_prompt, system_prompt, attempt, max_tokens=512)
+    
+    async def execute(self, question: str, plan: str, attempt: int = 0) -> Dict[str, Any]:
+        """
+        Phase 2: Execute the plan to produce a solution.
         
-        while retry_count <= self.max_retries:
-            # Phase 1: Plan
-            plan = self.plan(question)
+        Args:
+            question: The user's question
+            plan: The plan from the planner phase
+            attempt: Attempt index (see _call_llm)
             
-            # Phase 2: Execute
-            solution = self.execute(question, plan)
+        Returns:
+            Dictionary with 'answer', 'reasoning', and 'intermediate_work'
+        """
+        executor_prompt = _EXECUTE_PROMPT.format(question=question, plan=plan)
+
+        system_prompt = _EXECUTE_SYSTEM
+
+        response_text = await self._call_llm(executor_prompt, system_prompt, attempt, max_tokens=1024)
+        
+        try:
+            result = _extract_json(response_text)
+            return result
+        except json.JSONDecodeError as e:
+            # Fallback if JSON parsing fails
+            return {
+                "answer": "Error parsing response",
+                "reasoning": response_text[:200] if len(response_text) > 200 else response_text,
+                "intermediate_work": response_text
+            }
+    
+    async def plan_and_execute(self, question: str, attempt: int = 0) -> Tuple[str, Dict[str, Any]]:
+        """
+        Phases 1 and 2 in a single LLM round-trip: plan the solution and carry it out.
+        
+        Args:
+            question: The user's question
+            attempt: Attempt index (see _call_llm)
             
-            # Phase 3: Verify
-            checks = self.verify(question, solution)
-            all_checks.extend(checks)
+        Returns:
+            Tuple of (plan as text, dictionary with 'answer', 'reasoning', and
+            'intermediate_work')
+        """
+        prompt = _PLAN_AND_EXECUTE_PROMPT.format(question=question)
+
+        system_prompt = _PLAN_AND_EXECUTE_SYSTEM
+
+        response_text = await self._call_llm(prompt, system_prompt, attempt,
+                                             max_tokens=_PLAN_AND_EXECUTE_MAX_TOKENS)
+        
+        try:
+            result = _extract_json(response_text)
+        except json.JSONDecodeError:
+            # Fallback if JSON parsing fails
+            return "N/A", {
+                "answer": "Error parsing response",
+                "reasoning": response_text[:200] if len(response_text) > 200 else response_text,
+                "intermediate_work": response_text
+            }
+        
+        plan = result.pop("plan", "N/A")
+        if isinstance(plan, list):
+            plan = "\n".join(f"{i}. {step}" for i, step in enumerate(plan, 1))
+        return plan, result
+    
+    async def verify(self, question: str, solution: Dict[str, Any],
+                     attempt: int = 0) -> List[Check]:
+        """
+        Phase 3: Verify the solution for correctness and consistency.
+        
+        Args:
+            question: The original question
+            solution: The solution from the executor
+            attempt: Attempt index (see _call_llm)
             
+        Returns:
+            List of Check objects indicating what passed/failed
+        """
+        verifier_prompt = _VERIFY_PROMPT.format(
+            question=question,
+            answer=solution['answer'],
+            reasoning=solution['reasoning'],
+            work=solution['intermediate_work'],
+        )
+
+        system_prompt = _VERIFY_SYSTEM
+
+        # Stream the checks so a failed one can end verification early
+        parser = _CheckStreamParser()
+        max_tokens = 1024
+        stream = self._stream_llm(verifier_prompt, system_prompt, attempt, max_tokens=max_tokens)
+        try:
+            streamed_checks = []
+            async for chunk in stream:
+                for check in parser.feed(chunk):
+                    streamed_checks.append(check)
+                    if not check.passed:
+                        # One failure already fails this attempt
+                        return streamed_checks
+        except _IncompleteResponse as e:
+            # The checks that did arrive all passed, but the rest are missing
+            return [Check(
+                check_name="Verification Error",
+                passed=False,
+                details=f"Verification response was incomplete ({e})"
+            )]
+        finally:
+            await stream.aclose()
+        response_text = parser.text
+        
+        checks = self._parse_checks(response_text)
+        if not all(check.passed for check in checks):
+            # A failing verdict must not be replayed if this solution recurs
+            self._forget(verifier_prompt, system_prompt, attempt, max_tokens)
+        return checks
+    
+    @staticmethod
+    def _parse_checks(response_text: str) -> List[Check]:
+        """Parse a verifier response into checks, salvaging what it can."""
+        try:
+            checks_data = _extract_json(response_text, array=True)
+            checks = [Check(**check) for check in checks_data]
+            return checks
+        except (json.JSONDecodeError, TypeError, KeyError):
+            print(f"Warning: Could not parse verification JSON. Response was: {response_text[:200]}")
+            
+            # Salvage whatever pass/fail verdicts the response does contain
+            salvaged = [
+                Check(
+                    check_name=f"Check {i}",
+                    passed=match.group(1) == "true",
+                    details="Recovered from a verification response that was not valid JSON"
+                )
+                for i, match in enumerate(_PASSED_RE.finditer(response_text), 1)
+            ]
+            if salvaged:
+                return salvaged
+            return [Check(
+                check_name="Verification Error",
+                passed=False,
+                details=f"Could not parse verification properly. Raw response: {response_text[:200]}"
+            )]
+    
+    async def verify_batch(self, question: str,
+                           solutions: List[Dict[str, Any]]) -> List[List[Check]]:
+        """
+        Phase 3 for several candidate solutions in a single LLM call.
+        
+        Falls back to verifying each candidate separately if the batched
+        response can't be parsed into one check list per candidate.
+        
+        Args:
+            question: The original question
+            solutions: Candidate solutions from the executor
+            
+        Returns:
+            One list of Check objects per solution, in the same order
+        """
+        candidates = dump_json([
+            {
+                "id": i,
+                "answer": solution['answer'],
+                "reasoning": solution['reasoning'],
+                "work": solution['intermediate_work'],
+            }
+            for i, solution in enumerate(solutions)
+        ])
+        
+        verifier_prompt = _VERIFY_BATCH_PROMPT.format(
+            count=len(solutions), question=question, candidates=candidates
+        )
+
+        system_prompt = _VERIFY_SYSTEM
+
+        max_tokens = 1024 * len(solutions)
+        response_text = await self._call_llm(verifier_prompt, system_prompt,
+                                             max_tokens=max_tokens)
+        
+        try:
+            batch_data = _extract_json(response_text, array=True)
+            if len(batch_data) != len(solutions) or not all(batch_data):
+                raise ValueError("Expected a non-empty check list for every candidate")
+            checks_per_solution = [[Check(**check) for check in checks_data] for checks_data in batch_data]
+        except (json.JSONDecodeError, TypeError, KeyError, ValueError):
+            self._forget(verifier_prompt, system_prompt, 0, max_tokens)
+            print("Warning: Could not parse batched verification JSON. Verifying candidates separately.")
+            return list(await asyncio.gather(*(
+                self.verify(question, solution, attempt)
+                for attempt, solution in enumerate(solutions)
+            )))
+        
+        if not all(check.passed for checks in checks_per_solution for check in checks):
+            self._forget(verifier_prompt, system_prompt, 0, max_tokens)
+        return checks_per_solution
+    
+    async def _solve(self, question: str) -> AgentResponse:
+        """Run the full pipeline for a question on the shared loop."""
+        # Speculatively generate every allowed attempt at once, then verify
+        # all candidates together and keep the first one that passes.
+        candidates = await asyncio.gather(*(
+            self.plan_and_execute(question, attempt)
+            for attempt in range(self.max_retries + 1)
+        ))
+        solutions = [solution for _, solution in candidates]
+        
+        # Recheck plain arithmetic locally first; candidates with a wrong
+        # calculation are rejected without an LLM call, the rest are verified
+        checks_per_solution = [_local_verify(solution) for solution in solutions]
+        pending = [i for i, checks in enumerate(checks_per_solution) if checks is None]
+        if len(pending) > 1:
+            verified = await self.verify_batch(question, [solutions[i] for i in pending])
+        elif pending:
+            verified = [await self.verify(question, solutions[pending[0]], pending[0])]
+        else:
+            verified = []
+        for i, checks in zip(pending, verified):
+            checks_per_solution[i] = checks
+        
+        retry_count = 0
+        
+        for (plan, solution), checks in zip(candidates, checks_per_solution):
             # Check if all verifications passed
-            all_passed = all(check.passed for check in checks)
+            all_passed = checks is not None and all(check.passed for check in checks)
             
-            if all_passed:
+            if not all_passed:
+                # Don't replay a rejected sample from the cache on the next solve
+                self._forget_candidate(question, attempt=retry_count)
+            else:
                 # Success!
                 return AgentResponse(
                     answer=solution['answer'],
@@ -352,40 +1043,83 @@ Be thorough and catch any errors or inconsistencies."""
                     reasoning_visible_to_user=solution['reasoning'],
                     metadata={
                         "plan": plan,
-                        "checks": [asdict(check) for check in checks],
+                        "checks": [check.to_dict() for check in checks],
                         "retries": retry_count
                     }
                 )
             
             retry_count += 1
-            
-            if retry_count <= self.max_retries:
-                # Retry with feedback
-                continue
         
-        # All retries exhausted
-        failed_checks = [check for check in all_checks if not check.passed]
+        # All retries exhausted; report the last attempt's failures
+        last_checks = checks
         failure_summary = "; ".join([f"{check.check_name}: {check.details}" 
-                                     for check in failed_checks[-3:]])  # Last 3 failures
+                                     for check in last_checks if not check.passed])
         
         return AgentResponse(
             answer="Unable to verify solution",
             status="failed",
             reasoning_visible_to_user=f"Verification failed after {self.max_retries} retries. Issues: {failure_summary}",
             metadata={
-                "plan": plan if 'plan' in locals() else "N/A",
-                "checks": [asdict(check) for check in all_checks],
+                "plan": plan,
+                "checks": [check.to_dict() for check in last_checks],
                 "retries": retry_count
             }
         )
 
 
+class CachedReasoningAgent(_SolveEntryPoints):
+    """
+    Wraps a ReasoningAgent with a persistent cache of solved questions.
+    
+    Questions are matched after normalizing case and whitespace, so asking
+    the same question twice (e.g. re-running the test suite) skips the LLM
+    entirely. Only successful responses are stored. A failed question is
+    solved again on the next call, and since the wrapped agent evicts
+    rejected attempts from its LLM cache, that retry really resamples.
+    Any other attribute is delegated to the wrapped agent.
+    """
+    
+    def __init__(self, agent: ReasoningAgent, path: str = ".agent_cache"):
+        """
+        Args:
+            agent: The agent that answers cache misses
+            path: Location of the on-disk cache
+        """
+        self.agent = agent
+        self._cache = _DiskCache(path)
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.agent, name)
+    
+    @staticmethod
+    def _key(question: str) -> str:
+        normalized = " ".join(question.lower().split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    
+    async def _solve(self, question: str) -> AgentResponse:
+        key = self._key(question)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return AgentResponse.from_dict(json.loads(cached))
+        
+        result = await self.agent._solve(question)
+        if result.status == "success":
+            self._cache.set(key, dump_json(result.to_dict()))
+        return result
+
+
 def main():
     """CLI interface for the reasoning agent"""
-    print("Multi-Step Reasoning Agent (Powered by Google Gemini)")
-    print("=" * 50)
-    print("Type your question or 'quit' to exit.")
-    print()
+    try:
+        import readline  # noqa: F401 - enables line editing and history for input()
+    except ImportError:  # Not available on Windows
+        pass
+    
+    sys.stdout.write(
+        "Multi-Step Reasoning Agent (Powered by Google Gemini)\n"
+        f"{'=' * 50}\n"
+        "Type your question or 'quit' to exit.\n\n"
+    )
     
     # Check for API key
     if not os.getenv("GEMINI_API_KEY"):
@@ -413,26 +1147,26 @@ def main():
         if not question:
             continue
         
-        print("\nProcessing...\n")
+        sys.stdout.write("\nProcessing...\n\n")
         
         try:
             result = agent.solve(question)
             
-            # Display user-facing information
-            print("=" * 50)
-            print(f"ANSWER: {result.answer}")
-            print(f"STATUS: {result.status}")
-            print(f"\nREASONING: {result.reasoning_visible_to_user}")
-            print("=" * 50)
-            
-            # Optionally show metadata
-            print(f"\n[Metadata: {result.metadata['retries']} retries, "
-                  f"{len(result.metadata['checks'])} checks performed]")
+            # Display user-facing information and metadata in one write
+            sys.stdout.write(
+                f"{'=' * 50}\n"
+                f"ANSWER: {result.answer}\n"
+                f"STATUS: {result.status}\n"
+                f"\nREASONING: {result.reasoning_visible_to_user}\n"
+                f"{'=' * 50}\n"
+                f"\n[Metadata: {result.metadata['retries']} retries, "
+                f"{len(result.metadata['checks'])} checks performed]\n"
+            )
             
             # Show full JSON if needed
             show_full = input("\nShow full JSON? (y/n): ").strip().lower()
             if show_full == 'y':
-                print(json.dumps(result.to_dict(), indent=2))
+                print(dump_json(result.to_dict()))
         
         except Exception as e:
             print(f"ERROR: {str(e)}")
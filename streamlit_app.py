@@ -4,11 +4,12 @@ Interactive web interface for the reasoning agent with test suite capabilities
 """
 
 import streamlit as st
-import json
+import concurrent.futures
 import os
 from datetime import datetime
-from reasoning_agent import ReasoningAgent, AgentResponse
-from test_agent import EASY_TESTS, TRICKY_TESTS, check_answer
+from typing import Optional
+from reasoning_agent import FREE_TIER_QPM, ReasoningAgent, CachedReasoningAgent, AgentResponse, dump_json_bytes
+from test_agent import EASY_TESTS, TRICKY_TESTS, EASY_TESTS_PREP, TRICKY_TESTS_PREP, check_answer_prepared
 import pandas as pd
 
 # Page configuration
@@ -20,7 +21,7 @@ st.set_page_config(
 )
 
 # Custom CSS for better styling
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -29,12 +30,6 @@ st.markdown("""
         text-align: center;
         padding: 1rem 0;
     }
-    .sub-header {
-        font-size: 1.5rem;
-        font-weight: bold;
-        color: #2c3e50;
-        margin-top: 1rem;
-    }
     .success-box {
         background-color: #d4edda;
         border-left: 5px solid #28a745;
@@ -49,63 +44,54 @@ st.markdown("""
         margin: 1rem 0;
         border-radius: 5px;
     }
-    .info-box {
-        background-color: #d1ecf1;
-        border-left: 5px solid #17a2b8;
-        padding: 1rem;
-        margin: 1rem 0;
-        border-radius: 5px;
-    }
-    .warning-box {
-        background-color: #fff3cd;
-        border-left: 5px solid #ffc107;
-        padding: 1rem;
-        margin: 1rem 0;
-        border-radius: 5px;
-    }
-    .metric-card {
-        background-color: #f8f9fa;
-        padding: 1rem;
-        border-radius: 10px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    .stButton>button {
+    .stButton>button, .stFormSubmitButton>button {
         width: 100%;
         background-color: #1f77b4;
         color: white;
         font-weight: bold;
     }
-    .check-passed {
-        color: #28a745;
-        font-weight: bold;
-    }
-    .check-failed {
-        color: #dc3545;
-        font-weight: bold;
-    }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_data
+def _css() -> str:
+    """Custom CSS with indentation and newlines stripped, built once per server"""
+    return " ".join(line.strip() for line in CUSTOM_CSS.splitlines() if line.strip())
+
+st.markdown(_css(), unsafe_allow_html=True)
 
 # Initialize session state
-if 'agent' not in st.session_state:
-    st.session_state.agent = None
+if 'agent_config' not in st.session_state:
+    st.session_state.agent_config = None
 if 'history' not in st.session_state:
     st.session_state.history = []
 if 'test_results' not in st.session_state:
     st.session_state.test_results = None
+    st.session_state.test_df = None
+    st.session_state.test_results_json = None
+    # Rows finished so far in the current run; kept if a rerun interrupts it
+    st.session_state.partial_results = None
+if 'history_json' not in st.session_state:
+    # (number of entries serialized, JSON bytes); history only grows or is cleared
+    st.session_state.history_json = (0, b"[]")
+
+@st.cache_resource
+def get_agent(api_key: str, max_retries: int, max_qpm: int = FREE_TIER_QPM) -> CachedReasoningAgent:
+    """Build the agent once per configuration, shared across sessions and reruns"""
+    return CachedReasoningAgent(ReasoningAgent(api_key=api_key, max_retries=max_retries, max_qpm=max_qpm))
 
-def initialize_agent(api_key: str, max_retries: int = 2):
+def initialize_agent(api_key: str, max_retries: int = 2, max_qpm: int = FREE_TIER_QPM):
     """Initialize the reasoning agent with API key"""
     try:
         os.environ['GEMINI_API_KEY'] = api_key # uncomment this while running it locally
         #api_key = st.secrets["GEMINI_API_KEY"]#comment this while running locally
-        agent = ReasoningAgent(api_key=api_key, max_retries=max_retries)
-        st.session_state.agent = agent
+        get_agent(api_key, max_retries, max_qpm)
+        st.session_state.agent_config = (api_key, max_retries, max_qpm)
         return True, "Agent initialized successfully! 🎉"
     except Exception as e:
         return False, f"Error initializing agent: {str(e)}"
 
-def display_result(result: AgentResponse, question: str):
+def display_result(result: AgentResponse, question: str, result_dict: Optional[dict] = None):
     """Display the agent's result in a formatted way"""
     
     # Status indicator
@@ -156,31 +142,54 @@ def display_result(result: AgentResponse, question: str):
     
     # Full JSON
     with st.expander("🔍 View Full JSON Response"):
-        st.json(result.to_dict())
+        st.json(result_dict if result_dict is not None else result.to_dict())
+
+# Columns of the results table; per-test details are read from the row dicts
+TABLE_COLUMNS = ['Test #', 'Category', 'Description', 'Correct', 'Status', 'Retries']
+
+# Low-cardinality columns, stored as categoricals so filters compare integer codes
+CATEGORY_DTYPES = {
+    'Category': pd.CategoricalDtype(['EASY', 'TRICKY']),
+    'Correct': pd.CategoricalDtype(['✅', '❌']),
+    'Status': pd.CategoricalDtype(['success', 'failed', 'error']),
+}
+
+def results_frame(results: list) -> pd.DataFrame:
+    """Build the results table column by column from the result rows"""
+    return pd.DataFrame({col: [row[col] for row in results] for col in TABLE_COLUMNS}).astype(CATEGORY_DTYPES)
 
-def run_test_suite(agent: ReasoningAgent, test_category: str, progress_bar, status_text):
-    """Run a test suite and return results"""
+# Number of history entries rendered per page in the History tab
+HISTORY_PAGE_SIZE = 20
+
+def run_test_suite(agent: ReasoningAgent, test_category: str, progress_bar, status_text,
+                   table_placeholder):
+    """Run a test suite, showing each result as it completes, and return results"""
     
-    if test_category == "Easy":
-        tests = EASY_TESTS
-    elif test_category == "Tricky":
-        tests = TRICKY_TESTS
-    else:  # All
-        tests = EASY_TESTS + TRICKY_TESTS
+    # Tag each test with its category up front
+    tests = []
+    if test_category in ("Easy", "All"):
+        tests += [('EASY', test, expected) for test, expected in EASY_TESTS_PREP]
+    if test_category in ("Tricky", "All"):
+        tests += [('TRICKY', test, expected) for test, expected in TRICKY_TESTS_PREP]
     
-    results = []
+    # Dispatch every test at once; the agent bounds how many run concurrently
+    futures = {agent.submit(test['question']): i for i, (_, test, _) in enumerate(tests)}
+    results = [None] * len(tests)
+    completed = st.session_state.partial_results = []
     
-    for i, test in enumerate(tests):
-        status_text.text(f"Running test {i+1}/{len(tests)}: {test['description']}")
-        progress_bar.progress((i + 1) / len(tests))
+    for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+        i = futures[future]
+        category, test, expected = tests[i]
+        status_text.text(f"Completed test {done}/{len(tests)}: {test['description']}")
+        progress_bar.progress(done / len(tests))
         
         try:
-            result = agent.solve(test['question'])
-            answer_correct = check_answer(result.answer, test['expected_answer_contains'])
+            result = future.result()
+            answer_correct = check_answer_prepared(result.answer, expected)
             
-            results.append({
+            results[i] = {
                 'Test #': i + 1,
-                'Category': 'EASY' if test in EASY_TESTS else 'TRICKY',
+                'Category': category,
                 'Description': test['description'],
                 'Question': test['question'],
                 'Answer': result.answer,
@@ -190,11 +199,11 @@ def run_test_suite(agent: ReasoningAgent, test_category: str, progress_bar, stat
                 'Retries': result.metadata['retries'],
                 'Checks Passed': all(c['passed'] for c in result.metadata['checks']),
                 'Full Result': result.to_dict()
-            })
+            }
         except Exception as e:
-            results.append({
+            results[i] = {
                 'Test #': i + 1,
-                'Category': 'EASY' if test in EASY_TESTS else 'TRICKY',
+                'Category': category,
                 'Description': test['description'],
                 'Question': test['question'],
                 'Answer': 'ERROR',
@@ -204,7 +213,11 @@ def run_test_suite(agent: ReasoningAgent, test_category: str, progress_bar, stat
                 'Retries': 0,
                 'Checks Passed': False,
                 'Error': str(e)
-            })
+            }
+        
+        completed.append(results[i])
+        completed.sort(key=lambda row: row['Test #'])
+        table_placeholder.dataframe(results_frame(completed), use_container_width=True)
     
     return results
 
@@ -219,40 +232,55 @@ def main():
     with st.sidebar:
         st.markdown("## ⚙️ Configuration")
         
-        # API Key input
-        api_key = st.text_input(
-            "Google Gemini API Key",
-            type="password",
-            value=os.getenv("GEMINI_API_KEY", ""),
-            help="Get your free API key from https://makersuite.google.com/app/apikey"
-        )
-        
-        # Max retries
-        max_retries = st.slider(
-            "Max Retries",
-            min_value=0,
-            max_value=5,
-            value=2,
-            help="Number of retry attempts if verification fails"
-        )
+        # Widgets in a form only commit (and rerun the app) on submit
+        with st.form("config_form"):
+            # API Key input
+            api_key = st.text_input(
+                "Google Gemini API Key",
+                type="password",
+                value=os.getenv("GEMINI_API_KEY", ""),
+                help="Get your free API key from https://makersuite.google.com/app/apikey"
+            )
+            
+            # Max retries
+            max_retries = st.slider(
+                "Max Retries",
+                min_value=0,
+                max_value=5,
+                value=2,
+                help="Number of retry attempts if verification fails"
+            )
+            
+            # Request quota
+            max_qpm = st.number_input(
+                "Requests per Minute",
+                min_value=1,
+                max_value=10000,
+                value=FREE_TIER_QPM,
+                help="Your Gemini API quota; the free tier allows 15 requests per minute"
+            )
+            
+            # Initialize button
+            submitted = st.form_submit_button("🚀 Initialize Agent")
         
-        # Initialize button
-        if st.button("🚀 Initialize Agent"):
+        if submitted:
             if not api_key:
                 st.error("Please provide an API key!")
             else:
-                success, message = initialize_agent(api_key, max_retries)
+                success, message = initialize_agent(api_key, max_retries, max_qpm)
                 if success:
                     st.success(message)
                 else:
                     st.error(message)
         
         # Agent status
+        agent = get_agent(*st.session_state.agent_config) if st.session_state.agent_config else None
         st.markdown("---")
         st.markdown("## 📊 Agent Status")
-        if st.session_state.agent:
+        if agent:
             st.success("✅ Agent Ready")
-            st.info(f"Max Retries: {st.session_state.agent.max_retries}")
+            st.info(f"Max Retries: {agent.max_retries}")
+            st.info(f"Requests per Minute: {agent.max_qpm}")
         else:
             st.warning("⚠️ Agent Not Initialized")
         
@@ -269,6 +297,7 @@ def main():
             st.info(f"Total queries: {len(st.session_state.history)}")
             if st.button("Clear History"):
                 st.session_state.history = []
+                st.session_state.history_json = (0, b"[]")
                 st.rerun()
     
     # Main content area with tabs
@@ -278,7 +307,7 @@ def main():
     with tab1:
         st.markdown("### Ask the Reasoning Agent")
         
-        if not st.session_state.agent:
+        if not agent:
             st.warning("⚠️ Please initialize the agent first using the sidebar configuration.")
         else:
             # Example questions
@@ -319,18 +348,19 @@ def main():
                 else:
                     with st.spinner("🤔 Thinking... Planning, Executing, and Verifying..."):
                         try:
-                            result = st.session_state.agent.solve(question)
+                            result = agent.solve(question)
+                            result_dict = result.to_dict()
                             
                             # Add to history
                             st.session_state.history.append({
                                 'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                                 'question': question,
-                                'result': result.to_dict()
+                                'result': result_dict
                             })
                             
                             # Display result
                             st.markdown("---")
-                            display_result(result, question)
+                            display_result(result, question, result_dict)
                             
                         except Exception as e:
                             st.error(f"❌ Error: {str(e)}")
@@ -339,7 +369,7 @@ def main():
     with tab2:
         st.markdown("### 🧪 Test Suite Runner")
         
-        if not st.session_state.agent:
+        if not agent:
             st.warning("⚠️ Please initialize the agent first using the sidebar configuration.")
         else:
             st.info("Run predefined test cases to evaluate the agent's performance on easy and tricky questions.")
@@ -367,29 +397,43 @@ def main():
             if st.button("▶️ Run Test Suite", type="primary"):
                 progress_bar = st.progress(0)
                 status_text = st.empty()
+                table_placeholder = st.empty()
+                st.session_state.test_results = None
                 
                 results = run_test_suite(
-                    st.session_state.agent,
+                    agent,
                     test_category,
                     progress_bar,
-                    status_text
+                    status_text,
+                    table_placeholder
                 )
                 
+                table_placeholder.empty()
+                st.session_state.partial_results = None
                 st.session_state.test_results = results
+                st.session_state.test_df = results_frame(results)
+                st.session_state.test_results_json = None
                 status_text.text("✅ Tests completed!")
                 progress_bar.empty()
             
+            elif st.session_state.partial_results:
+                # A rerun stopped the last run part-way; keep what finished
+                partial = st.session_state.partial_results
+                st.warning(f"⚠️ Test run was interrupted after {len(partial)} tests. Run the suite again for full results.")
+                st.dataframe(results_frame(partial), use_container_width=True)
+            
             # Display results if available
             if st.session_state.test_results:
                 st.markdown("---")
                 st.markdown("### 📊 Test Results")
                 
-                df = pd.DataFrame(st.session_state.test_results)
+                df = st.session_state.test_df
                 
                 # Summary metrics
+                correct_mask = df['Correct'] == '✅'
                 total_tests = len(df)
-                correct_answers = len(df[df['Correct'] == '✅'])
-                success_status = len(df[df['Status'] == 'success'])
+                correct_answers = int(correct_mask.sum())
+                success_status = int((df['Status'] == 'success').sum())
                 
                 col1, col2, col3, col4 = st.columns(4)
                 
@@ -419,30 +463,32 @@ def main():
                     st.markdown("### 📈 Category Breakdown")
                     col1, col2 = st.columns(2)
                     
+                    easy_mask = df['Category'] == 'EASY'
+                    easy_total = int(easy_mask.sum())
+                    easy_correct = int((correct_mask & easy_mask).sum())
+                    tricky_total = total_tests - easy_total
+                    tricky_correct = correct_answers - easy_correct
+                    
                     with col1:
-                        easy_df = df[df['Category'] == 'EASY']
-                        easy_correct = len(easy_df[easy_df['Correct'] == '✅'])
-                        st.info(f"**Easy Tests:** {easy_correct}/{len(easy_df)} correct ({easy_correct/len(easy_df)*100:.1f}%)")
+                        st.info(f"**Easy Tests:** {easy_correct}/{easy_total} correct ({easy_correct/easy_total*100:.1f}%)")
                     
                     with col2:
-                        tricky_df = df[df['Category'] == 'TRICKY']
-                        tricky_correct = len(tricky_df[tricky_df['Correct'] == '✅'])
-                        st.info(f"**Tricky Tests:** {tricky_correct}/{len(tricky_df)} correct ({tricky_correct/len(tricky_df)*100:.1f}%)")
+                        st.info(f"**Tricky Tests:** {tricky_correct}/{tricky_total} correct ({tricky_correct/tricky_total*100:.1f}%)")
                 
                 # Results table
                 st.markdown("### 📋 Detailed Results")
-                display_df = df[['Test #', 'Category', 'Description', 'Correct', 'Status', 'Retries']].copy()
-                st.dataframe(display_df, use_container_width=True, height=400)
+                st.dataframe(df, use_container_width=True, height=400)
                 
                 # Individual test details
                 st.markdown("### 🔍 Test Details")
+                by_num = {row['Test #']: row for row in st.session_state.test_results}
                 test_num = st.selectbox(
                     "Select a test to view details:",
-                    options=df['Test #'].tolist(),
-                    format_func=lambda x: f"Test #{x}: {df[df['Test #'] == x]['Description'].iloc[0]}"
+                    options=list(by_num),
+                    format_func=lambda x: f"Test #{x}: {by_num[x]['Description']}"
                 )
                 
-                selected_test = df[df['Test #'] == test_num].iloc[0]
+                selected_test = by_num[test_num]
                 
                 st.markdown(f"#### Test #{test_num}: {selected_test['Description']}")
                 st.write(f"**Question:** {selected_test['Question']}")
@@ -459,10 +505,12 @@ def main():
                 col1, col2 = st.columns([1, 3])
                 with col1:
                     if st.button("💾 Export Results (JSON)"):
-                        json_str = json.dumps(st.session_state.test_results, indent=2)
+                        # Serialize once per test run and reuse on later reruns
+                        if st.session_state.test_results_json is None:
+                            st.session_state.test_results_json = dump_json_bytes(st.session_state.test_results)
                         st.download_button(
                             label="Download JSON",
-                            data=json_str,
+                            data=st.session_state.test_results_json,
                             file_name=f"test_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                             mime="application/json"
                         )
@@ -474,24 +522,37 @@ def main():
         if not st.session_state.history:
             st.info("No queries in history yet. Ask some questions to see them here!")
         else:
-            st.info(f"Total queries: {len(st.session_state.history)}")
+            history = st.session_state.history
+            st.info(f"Total queries: {len(history)}")
+            
+            # Only render one page of entries per rerun
+            num_pages = (len(history) - 1) // HISTORY_PAGE_SIZE + 1
+            page = 1
+            if num_pages > 1:
+                page = st.number_input("Page", min_value=1, max_value=num_pages, value=1)
+            end = len(history) - (page - 1) * HISTORY_PAGE_SIZE
+            start = max(end - HISTORY_PAGE_SIZE, 0)
             
             # Display history in reverse chronological order
-            for i, entry in enumerate(reversed(st.session_state.history), 1):
+            for n in range(end - 1, start - 1, -1):
+                entry = history[n]
                 with st.expander(f"🕒 {entry['timestamp']} - {entry['question'][:50]}..."):
                     st.write(f"**Question:** {entry['question']}")
                     st.write(f"**Answer:** {entry['result']['answer']}")
                     st.write(f"**Status:** {entry['result']['status']}")
                     
-                    with st.expander("View Full Details"):
+                    # Expander bodies render even when collapsed, so the full
+                    # JSON sits behind a toggle instead
+                    if st.toggle("View Full Details", key=f"hist_open_{n}"):
                         st.json(entry['result'])
             
             # Export history
             if st.button("💾 Export History"):
-                json_str = json.dumps(st.session_state.history, indent=2)
+                if st.session_state.history_json[0] != len(history):
+                    st.session_state.history_json = (len(history), dump_json_bytes(history))
                 st.download_button(
                     label="Download History (JSON)",
-                    data=json_str,
+                    data=st.session_state.history_json[1],
                     file_name=f"query_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                     mime="application/json"
                 )
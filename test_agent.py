@@ -3,9 +3,10 @@ Test suite for the Multi-Step Reasoning Agent
 Tests include easy and tricky questions to validate the agent's capabilities.
 """
 
-import json
 import os
-from reasoning_agent import ReasoningAgent
+from concurrent.futures import Future
+from typing import Optional
+from reasoning_agent import ReasoningAgent, dump_json
 
 
 # Test cases categorized by difficulty
@@ -80,23 +81,43 @@ TRICKY_TESTS = [
     },
 ]
 
+# Tests paired with their expected substrings, lowercased once at import
+EASY_TESTS_PREP = [(t, tuple(e.lower() for e in t['expected_answer_contains'])) for t in EASY_TESTS]
+TRICKY_TESTS_PREP = [(t, tuple(e.lower() for e in t['expected_answer_contains'])) for t in TRICKY_TESTS]
+
 
 def check_answer(answer: str, expected_contains: list) -> bool:
     """
-    Check if the answer contains any of the expected substrings.
+    Check if the answer contains any of the expected substrings (case-insensitive).
     
     Args:
         answer: The actual answer from the agent
         expected_contains: List of acceptable answer substrings
         
+    Returns:
+        True if answer contains any expected substring
+    """
+    return check_answer_prepared(answer, tuple(e.lower() for e in expected_contains))
+
+
+def check_answer_prepared(answer: str, expected_lower: tuple) -> bool:
+    """
+    Like check_answer(), for expected substrings that are already lowercased.
+    
+    Args:
+        answer: The actual answer from the agent
+        expected_lower: Lowercased acceptable substrings, as stored in
+            EASY_TESTS_PREP / TRICKY_TESTS_PREP
+        
     Returns:
         True if answer contains any expected substring
     """
     answer_lower = answer.lower()
-    return any(expected.lower() in answer_lower for expected in expected_contains)
+    return any(expected in answer_lower for expected in expected_lower)
 
 
-def run_test(agent: ReasoningAgent, test: dict, test_num: int, category: str) -> dict:
+def run_test(agent: ReasoningAgent, test: dict, test_num: int, category: str,
+             pending: Optional[Future] = None, expected: Optional[tuple] = None) -> dict:
     """
     Run a single test case and return results.
     
@@ -105,6 +126,10 @@ def run_test(agent: ReasoningAgent, test: dict, test_num: int, category: str) ->
         test: Test case dictionary
         test_num: Test number for display
         category: "EASY" or "TRICKY"
+        pending: Future from agent.submit() for this test, if it was
+            already dispatched; otherwise the test is solved here
+        expected: Lowercased expected substrings; derived from the test
+            case if not given
         
     Returns:
         Dictionary with test results
@@ -115,7 +140,7 @@ def run_test(agent: ReasoningAgent, test: dict, test_num: int, category: str) ->
     print(f"Question: {test['question']}")
     
     try:
-        result = agent.solve(test['question'])
+        result = pending.result() if pending else agent.solve(test['question'])
         
         print(f"\nAnswer: {result.answer}")
         print(f"Status: {result.status}")
@@ -131,7 +156,10 @@ def run_test(agent: ReasoningAgent, test: dict, test_num: int, category: str) ->
             print(f"    {status} {check['check_name']}: {check['details'][:100]}")
         
         # Verify answer
-        answer_correct = check_answer(result.answer, test['expected_answer_contains'])
+        if expected is None:
+            answer_correct = check_answer(result.answer, test['expected_answer_contains'])
+        else:
+            answer_correct = check_answer_prepared(result.answer, expected)
         print(f"\n{'✓' if answer_correct else '✗'} Expected answer validation: "
               f"{'PASS' if answer_correct else 'FAIL'}")
         
@@ -183,13 +211,18 @@ def run_all_tests():
     agent = ReasoningAgent(max_retries=2)
     results = []
     
+    # Dispatch every test up front so they solve concurrently; results are
+    # still reported in order below
+    easy_pending = [agent.submit(test['question']) for test in EASY_TESTS]
+    tricky_pending = [agent.submit(test['question']) for test in TRICKY_TESTS]
+    
     # Run easy tests
     print(f"\n\n{'#'*70}")
     print("# EASY TESTS")
     print(f"{'#'*70}")
     
-    for i, test in enumerate(EASY_TESTS, 1):
-        result = run_test(agent, test, i, "EASY")
+    for i, ((test, expected), pending) in enumerate(zip(EASY_TESTS_PREP, easy_pending), 1):
+        result = run_test(agent, test, i, "EASY", pending, expected)
         results.append(result)
     
     # Run tricky tests
@@ -197,8 +230,8 @@ def run_all_tests():
     print("# TRICKY TESTS")
     print(f"{'#'*70}")
     
-    for i, test in enumerate(TRICKY_TESTS, len(EASY_TESTS) + 1):
-        result = run_test(agent, test, i, "TRICKY")
+    for i, ((test, expected), pending) in enumerate(zip(TRICKY_TESTS_PREP, tricky_pending), len(EASY_TESTS) + 1):
+        result = run_test(agent, test, i, "TRICKY", pending, expected)
         results.append(result)
     
     # Generate summary
@@ -230,8 +263,8 @@ def run_all_tests():
     
     # Save results to JSON
     output_file = "test_results.json"
-    with open(output_file, 'w') as f:
-        json.dump(results, f, indent=2)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(dump_json(results))
     
     print(f"\nDetailed results saved to: {output_file}")
     
@@ -256,7 +289,7 @@ def run_single_test(question: str):
     print("\n" + "="*70)
     print("RESULT")
     print("="*70)
-    print(json.dumps(result.to_dict(), indent=2))
+    print(dump_json(result.to_dict()))
 
 
 if __name__ == "__main__":
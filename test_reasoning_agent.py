@@ -0,0 +1,269 @@
+"""
+Unit tests for the offline helpers (no API key or network needed).
+Run with: pytest test_reasoning_agent.py
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import reasoning_agent
+from reasoning_agent import (
+    CachedReasoningAgent, Check, ReasoningAgent, _CheckStreamParser, _extract_json, _local_verify,
+    dump_json, dump_json_bytes,
+)
+from test_agent import check_answer, check_answer_prepared
+
+
+def solution(work: str, answer: str = "0") -> dict:
+    return {"answer": answer, "reasoning": "", "intermediate_work": work}
+
+
+class FakeChunk:
+    """A Gemini response (or streamed chunk) that finished normally."""
+    
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [text] if text else []
+        self.candidates = [SimpleNamespace(finish_reason=1)]  # STOP
+        self.prompt_feedback = SimpleNamespace(block_reason=None)
+
+
+class FakeModel:
+    """
+    Stands in for genai.GenerativeModel. reply(prompt) returns the response
+    text, or for streamed calls a list of text chunks and exceptions to raise.
+    """
+    
+    model_name = "models/fake"
+    
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+    
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        self.prompts.append(prompt)
+        reply = self.reply(prompt)
+        if not stream:
+            return FakeChunk(reply)
+        return self._stream([reply] if isinstance(reply, str) else reply)
+    
+    async def _stream(self, parts):
+        for part in parts:
+            if isinstance(part, Exception):
+                raise part
+            yield FakeChunk(part)
+
+
+def make_agent(reply, **kwargs) -> ReasoningAgent:
+    kwargs.setdefault("use_cache", False)
+    agent = ReasoningAgent(api_key="test", max_qpm=10000, **kwargs)
+    agent.model = FakeModel(reply)
+    return agent
+
+
+def run(coro):
+    """Await a phase coroutine on the agent's shared loop."""
+    return asyncio.run_coroutine_threadsafe(coro, reasoning_agent._get_loop()).result()
+
+
+def check_json(name: str, passed: bool) -> str:
+    return json.dumps({"check_name": name, "passed": passed, "details": "d"})
+
+
+class TestLocalVerify:
+    def test_wrong_arithmetic_fails(self):
+        checks = _local_verify(solution("25 + 37 = 63", "63"))
+        assert [c.passed for c in checks] == [False]
+        assert "25 + 37 = 62, not 63" in checks[0].details
+
+    def test_correct_arithmetic_is_left_to_llm(self):
+        # Right calculation, wrong quantity: only the LLM can tell
+        assert _local_verify(solution("Alice now: 25 - 5 = 20", "20")) is None
+
+    def test_no_equations_is_inconclusive(self):
+        assert _local_verify(solution("Follow the plan step by step")) is None
+
+    def test_step_labels_are_ignored(self):
+        assert _local_verify(solution("Step 2 = 12 apples")) is None
+
+    def test_rounded_result_within_stated_precision(self):
+        assert _local_verify(solution("10 / 3 = 3.33", "3.33")) is None
+
+    def test_whole_number_division(self):
+        assert _local_verify(solution("50 / 15 = 3 books with 5 left over", "3")) is None
+        assert _local_verify(solution("50 / 15 = 4 boxes needed", "4")) is None
+
+    @pytest.mark.parametrize("work", [
+        "3 × 4 = 13, then 6 + 6 = 12",
+        "3 x 4 = 13, then 6 + 6 = 12",
+        "1,500 - 500 = 1,000",
+        "2^3 = 8",
+        "20% of 100 = 20",
+    ])
+    def test_unreadable_work_is_inconclusive(self, work):
+        assert _local_verify(solution(work)) is None
+
+    def test_unevaluable_expression_is_inconclusive(self):
+        assert _local_verify(solution("(1 + = 2")) is None
+        assert _local_verify(solution("5 / 0 = 1")) is None
+
+
+class TestExtractJson:
+    def test_plain_object(self):
+        assert _extract_json('{"answer": "4"}') == {"answer": "4"}
+
+    def test_fenced_object_with_prose(self):
+        text = 'Here you go:\n```json\n{"answer": "4", "note": "[x]"}\n```\nDone.'
+        assert _extract_json(text) == {"answer": "4", "note": "[x]"}
+
+    def test_array(self):
+        text = '```\n[{"passed": true}]\n```'
+        assert _extract_json(text, array=True) == [{"passed": True}]
+
+    def test_missing_json_raises(self):
+        with pytest.raises(json.JSONDecodeError):
+            _extract_json("no json here")
+
+
+class TestCheckStreamParser:
+    CHECKS = [
+        {"check_name": "Correctness", "passed": True, "details": "ok"},
+        {"check_name": "Logic", "passed": False, "details": "step 2 is wrong"},
+    ]
+
+    def test_checks_arrive_as_they_complete(self):
+        text = "```json\n" + json.dumps(self.CHECKS) + "\n```"
+        split = text.index("}") + 1
+        parser = _CheckStreamParser()
+        assert parser.feed(text[:split - 5]) == []
+        assert parser.feed(text[split - 5:split]) == [Check(**self.CHECKS[0])]
+        assert parser.feed(text[split:]) == [Check(**self.CHECKS[1])]
+
+    def test_objects_that_are_not_checks_are_skipped(self):
+        parser = _CheckStreamParser()
+        assert parser.feed('[{"unexpected": 1}, ' + json.dumps(self.CHECKS[0]) + ']') == [
+            Check(**self.CHECKS[0])
+        ]
+
+
+class TestDumpJson:
+    DATA = {"answer": "≈ 28 → ✅", "checks": [1, 2]}
+    
+    def test_fallback_keeps_non_ascii(self, monkeypatch):
+        monkeypatch.setattr(reasoning_agent, "orjson", None)
+        assert "≈ 28 → ✅" in dump_json(self.DATA)
+        assert dump_json_bytes(self.DATA) == dump_json(self.DATA).encode("utf-8")
+    
+    def test_orjson_and_fallback_match(self, monkeypatch):
+        if reasoning_agent.orjson is None:
+            pytest.skip("orjson not installed")
+        fast = dump_json(self.DATA)
+        monkeypatch.setattr(reasoning_agent, "orjson", None)
+        assert dump_json(self.DATA) == fast
+
+
+class TestParseChecks:
+    def test_valid_json(self):
+        checks = ReasoningAgent._parse_checks("[" + check_json("Correctness", True) + "]")
+        assert checks == [Check("Correctness", True, "d")]
+    
+    def test_broken_json_salvages_each_verdict(self):
+        text = '[{"check_name": "A", "passed": true, "details": "ok"}, {"passed": false, "details": "cut'
+        checks = ReasoningAgent._parse_checks(text)
+        assert [(c.check_name, c.passed) for c in checks] == [("Check 1", True), ("Check 2", False)]
+    
+    @pytest.mark.parametrize("text", [
+        "I could not run the checks.",
+        "The answer is correct, it is 4.",
+        '{"verdict": "correct", "answer": 4',
+    ])
+    def test_no_verdicts_fails(self, text):
+        checks = ReasoningAgent._parse_checks(text)
+        assert [(c.check_name, c.passed) for c in checks] == [("Verification Error", False)]
+
+
+class TestCheckAnswer:
+    @pytest.mark.parametrize("expected", [["2:30 PM"], ("2:30 PM",), ["2:30 pm"]])
+    def test_case_insensitive_for_any_sequence(self, expected):
+        assert check_answer("2:30 pm", expected)
+        assert check_answer("2:30 PM", expected)
+        assert not check_answer("2:15 pm", expected)
+
+    def test_prepared(self):
+        assert check_answer_prepared("The Answer Is 28", ("28", "answer is 28"))
+        assert not check_answer_prepared("The Answer Is 27", ("28",))
+
+
+class TestVerifyStream:
+    SOLUTION = solution("Alice is 25", "25")
+    
+    def test_dropped_stream_fails_verification(self):
+        passing = [check_json(f"Check {i}", True) for i in range(5)]
+        chunks = ["[" + passing[0] + ", ", passing[1] + ", ", ConnectionError("reset")]
+        agent = make_agent(lambda prompt: chunks)
+        
+        checks = run(agent.verify("Q?", self.SOLUTION))
+        assert [(c.check_name, c.passed) for c in checks] == [("Verification Error", False)]
+        assert "stream interrupted" in checks[0].details
+    
+    def test_dropped_stream_fails_solve(self):
+        answer = json.dumps({"plan": ["p"], "answer": "25", "reasoning": "r",
+                             "intermediate_work": "Alice is 25"})
+        chunks = ["[" + check_json("Correctness", True) + ", ", ConnectionError("reset")]
+        agent = make_agent(lambda prompt: chunks if "verifying" in prompt else answer,
+                           max_retries=0)
+        assert agent.solve("Q?").status == "failed"
+    
+    def test_stream_failing_before_any_text_retries_without_streaming(self):
+        replies = iter([[ConnectionError("reset")], "[" + check_json("Correctness", True) + "]"])
+        agent = make_agent(lambda prompt: next(replies))
+        
+        checks = run(agent.verify("Q?", self.SOLUTION))
+        assert [(c.check_name, c.passed) for c in checks] == [("Correctness", True)]
+
+
+class TestCaching:
+    QUESTION = "How old is Alice?"
+    ANSWER = json.dumps({"plan": ["p"], "answer": "25", "reasoning": "r",
+                         "intermediate_work": "Alice is 25"})
+    
+    def cached_agent(self, tmp_path, monkeypatch, passed: bool) -> ReasoningAgent:
+        monkeypatch.chdir(tmp_path)
+        verdict = "[" + check_json("Correctness", passed) + "]"
+        return make_agent(lambda prompt: verdict if "verifying" in prompt else self.ANSWER,
+                          use_cache=True, max_retries=0)
+    
+    def candidate_key(self, agent: ReasoningAgent) -> str:
+        return agent._cache_key(
+            reasoning_agent._PLAN_AND_EXECUTE_PROMPT.format(question=self.QUESTION),
+            reasoning_agent._PLAN_AND_EXECUTE_SYSTEM, 0,
+            agent._generation_config(reasoning_agent._PLAN_AND_EXECUTE_MAX_TOKENS)[1],
+        )
+    
+    def test_rejected_candidate_is_evicted(self, tmp_path, monkeypatch):
+        agent = self.cached_agent(tmp_path, monkeypatch, passed=False)
+        assert agent.solve(self.QUESTION).status == "failed"
+        assert agent._cache.get(self.candidate_key(agent)) is None
+        
+        # Both the candidate and the failing verdict are sampled again
+        calls = len(agent.model.prompts)
+        agent.solve(self.QUESTION)
+        assert len(agent.model.prompts) == 2 * calls
+    
+    def test_passing_solve_is_replayed(self, tmp_path, monkeypatch):
+        agent = self.cached_agent(tmp_path, monkeypatch, passed=True)
+        first = agent.solve(self.QUESTION)
+        assert first.status == "success"
+        assert agent._cache.get(self.candidate_key(agent)) == self.ANSWER
+        
+        calls = len(agent.model.prompts)
+        assert agent.solve(self.QUESTION).answer == first.answer
+        assert len(agent.model.prompts) == calls
+    
+    def test_question_key_ignores_case_and_whitespace(self):
+        key = CachedReasoningAgent._key
+        assert key("What is 2 + 2?") == key("  what is 2\t+  2?\n")
+        assert key("What is 2 + 2?") != key("What is 2 + 3?")